@@ -0,0 +1,447 @@
+#!/usr/bin/env python3
+"""
+TTS字幕视频播放器 - 后端性能基准测试
+使用本地替身（fake）代替 ffmpeg、whisper.cpp、edge_tts、Google翻译和远程视频站点，
+以可配置的并发量驱动各个接口，输出可在CI中对比的JSON报告。
+
+用法:
+    python benchmark.py --requests 50 --concurrency 8 --output bench.json
+"""
+
+import argparse
+import asyncio
+import contextlib
+import json
+import logging
+import math
+import os
+import resource
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import BytesIO
+from pathlib import Path
+
+import server
+
+ALL_BENCHMARKS = ['tts', 'translate', 'generate-subtitle', 'download', 'clean-vtt']
+
+# 假的ffmpeg: 支持 -version，复制输入到输出，并在stderr中打印时长
+FAKE_FFMPEG = '''#!{python}
+import shutil, sys
+args = sys.argv[1:]
+if '-version' in args:
+    print('ffmpeg version 6.0-fake Copyright (c) 2000-2023 the FFmpeg developers')
+    sys.exit(0)
+sys.stderr.write('  Duration: 00:00:02.50, start: 0.000000, bitrate: 48 kb/s\\n')
+if '-i' in args and len(args) > args.index('-i') + 1 and args[-1] != args[args.index('-i') + 1]:
+    src = args[args.index('-i') + 1]
+    try:
+        shutil.copyfile(src, args[-1])
+    except OSError:
+        pass
+sys.exit(0)
+'''
+
+# 假的whisper.cpp: 按配置的延迟休眠，然后在工作目录生成 {audio}.wav.vtt
+FAKE_WHISPER = '''#!{python}
+import os, sys, time
+from pathlib import Path
+args = sys.argv[1:]
+if '-h' in args:
+    sys.exit(0)
+audio = Path(args[args.index('-f') + 1])
+time.sleep(float(os.environ.get('BENCH_WHISPER_LATENCY', '0')))
+with open(f"{{audio.name}}.vtt", 'w', encoding='utf-8') as f:
+    f.write("WEBVTT\\n\\n")
+    for i in range(20):
+        f.write(f"00:00:{{i:02d}}.000 --> 00:00:{{i:02d}}.900\\n")
+        f.write(f"fake cue {{i}}\\n\\n")
+print(f"whisper fake transcribed {{audio.name}}")
+'''
+
+
+class FakeCommunicate:
+    """edge_tts.Communicate 的替身，按配置的延迟写出固定的音频字节"""
+
+    latency = 0.0
+    payload = b'ID3' + b'\x00' * 4096
+
+    def __init__(self, text, voice, rate='+0%', **kwargs):
+        self.text = text
+        self.voice = voice
+        self.rate = rate
+
+    async def save(self, audio_fname):
+        await asyncio.sleep(self.latency)
+        with open(audio_fname, 'wb') as f:
+            f.write(self.payload)
+
+
+class FakeTranslator:
+    """deep_translator.GoogleTranslator 的替身"""
+
+    latency = 0.0
+
+    def __init__(self, source='auto', target='en', **kwargs):
+        self.source = source
+        self.target = target
+
+    def translate(self, text, **kwargs):
+        time.sleep(self.latency)
+        return f"[{self.target}] {text}"
+
+
+class MediaHandler(BaseHTTPRequestHandler):
+    """本地视频服务器，任何 /media/*.mp4 路径都返回同一段视频字节"""
+
+    payload = b''
+    latency = 0.0
+
+    def _send_headers(self):
+        self.send_response(200)
+        self.send_header('Content-Type', 'video/mp4')
+        self.send_header('Content-Length', str(len(self.payload)))
+        self.end_headers()
+
+    def do_HEAD(self):
+        if not self.path.startswith('/media/'):
+            self.send_error(404)
+            return
+        self._send_headers()
+
+    def do_GET(self):
+        if not self.path.startswith('/media/'):
+            self.send_error(404)
+            return
+        time.sleep(self.latency)
+        self._send_headers()
+        self.wfile.write(self.payload)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def write_script(path, template):
+    """生成可执行的替身脚本"""
+    path.write_text(template.format(python=sys.executable), encoding='utf-8')
+    path.chmod(0o755)
+    return path
+
+
+def make_youtube_vtt(cue_count):
+    """生成带内嵌时间戳和滚动重复行的YouTube风格自动字幕"""
+    lines = ["WEBVTT", "Kind: captions", "Language: zh-Hans", ""]
+    for i in range(cue_count):
+        start = server.format_vtt_time(i * 2.0)
+        mid = server.format_vtt_time(i * 2.0 + 1.0)
+        end = server.format_vtt_time(i * 2.0 + 2.0)
+        lines.append(f"{start} --> {end} align:start position:0%")
+        if i > 0:
+            lines.append(f"line {i - 1}")
+        lines.append(f"line<{mid}><c> {i}</c>")
+        lines.append("")
+    return '\n'.join(lines) + '\n'
+
+
+def percentile(sorted_values, pct):
+    """最近秩法计算百分位数"""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(pct / 100.0 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+def process_peak_rss_kb(who=resource.RUSAGE_SELF):
+    """进程生命周期内的峰值RSS (KB)，RUSAGE_CHILDREN 为最大的已结束子进程"""
+    rss = resource.getrusage(who).ru_maxrss
+    # macOS 返回字节，Linux 返回KB
+    if sys.platform == 'darwin':
+        rss //= 1024
+    return rss
+
+
+def current_rss_kb():
+    """当前RSS (KB)，无 /proc 的平台返回 None"""
+    try:
+        with open('/proc/self/statm') as f:
+            pages = int(f.read().split()[1])
+    except (OSError, IndexError, ValueError):
+        return None
+    return pages * os.sysconf('SC_PAGE_SIZE') // 1024
+
+
+class RSSSampler:
+    """在后台线程中采样当前RSS，记录测试窗口内的峰值（不含ffmpeg/whisper子进程）"""
+
+    def __init__(self, interval=0.01):
+        self.interval = interval
+        self.start_kb = current_rss_kb()
+        self.peak_kb = self.start_kb
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self._sample()
+
+    def _sample(self):
+        rss = current_rss_kb()
+        if rss is not None and (self.peak_kb is None or rss > self.peak_kb):
+            self.peak_kb = rss
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self._sample()
+
+
+def run_load(name, call, total, concurrency):
+    """以给定并发执行 total 次 call(i)，统计延迟和吞吐"""
+    latencies = []
+    errors = []
+    lock = threading.Lock()
+
+    def worker(i):
+        error = None
+        start = time.perf_counter()
+        try:
+            if not call(i):
+                error = f"request {i} failed"
+        except Exception as e:
+            error = f"request {i}: {e}"
+        elapsed = time.perf_counter() - start
+        with lock:
+            latencies.append(elapsed)
+            if error:
+                errors.append(error)
+
+    with RSSSampler() as rss:
+        wall_start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            list(pool.map(worker, range(total)))
+        wall = time.perf_counter() - wall_start
+
+    latencies.sort()
+    ms = [v * 1000.0 for v in latencies]
+    return {
+        'name': name,
+        'requests': total,
+        'concurrency': concurrency,
+        'errors': len(errors),
+        'error_samples': errors[:3],
+        'wall_s': round(wall, 4),
+        'throughput_rps': round(total / wall, 2) if wall > 0 else 0.0,
+        'latency_ms': {
+            'min': round(ms[0], 3) if ms else 0.0,
+            'p50': round(percentile(ms, 50), 3),
+            'p95': round(percentile(ms, 95), 3),
+            'p99': round(percentile(ms, 99), 3),
+            'max': round(ms[-1], 3) if ms else 0.0,
+            'mean': round(sum(ms) / len(ms), 3) if ms else 0.0,
+        },
+        # 仅本测试项运行期间的峰值；Python不会归还已分配的内存，需结合 rss_start_kb 看增量
+        'rss_start_kb': rss.start_kb,
+        'peak_rss_kb': rss.peak_kb,
+    }
+
+
+class Bench:
+    """持有替身环境并为每个接口构造请求"""
+
+    def __init__(self, args, work_dir):
+        self.args = args
+        self.work_dir = work_dir
+        self.local = threading.local()
+
+        bin_dir = work_dir / 'bin'
+        bin_dir.mkdir()
+        self.ffmpeg = write_script(bin_dir / 'ffmpeg', FAKE_FFMPEG)
+        self.whisper = write_script(bin_dir / 'whisper', FAKE_WHISPER)
+        self.model = work_dir / 'ggml-fake.bin'
+        self.model.write_bytes(b'\x00' * 16)
+        # /api/tts 和 yt-dlp 直接调用PATH中的ffmpeg
+        os.environ['PATH'] = f"{bin_dir}{os.pathsep}{os.environ.get('PATH', '')}"
+        os.environ['BENCH_WHISPER_LATENCY'] = str(args.whisper_latency)
+
+        FakeCommunicate.latency = args.tts_latency
+        FakeTranslator.latency = args.translate_latency
+        server.edge_tts.Communicate = FakeCommunicate
+        server.GoogleTranslator = FakeTranslator
+
+        server.TEMP_DIR = work_dir / 'tmp'
+        server.TEMP_DIR.mkdir()
+
+        self.video_bytes = b'\x00\x00\x00\x18ftypmp42' + b'\x00' * (args.media_kb * 1024)
+        MediaHandler.payload = self.video_bytes
+        MediaHandler.latency = args.media_latency
+        self.media_server = ThreadingHTTPServer(('127.0.0.1', 0), MediaHandler)
+        threading.Thread(target=self.media_server.serve_forever, daemon=True).start()
+
+        self.vtt_source = work_dir / 'source.vtt'
+        self.vtt_source.write_text(make_youtube_vtt(args.vtt_cues), encoding='utf-8')
+
+    def close(self):
+        self.media_server.shutdown()
+        self.media_server.server_close()
+
+    @property
+    def client(self):
+        # 每个工作线程使用独立的测试客户端
+        if not hasattr(self.local, 'client'):
+            self.local.client = server.app.test_client()
+        return self.local.client
+
+    def key(self, i):
+        """--identical 模式下所有请求使用相同参数"""
+        return 0 if self.args.identical else i
+
+    def tts(self, i):
+        resp = self.client.post('/api/tts', json={
+            'text': f"这是第{self.key(i)}条字幕",
+            'voice': 'zh-CN-XiaoxiaoNeural',
+            'rate': 1.0,
+        })
+        return resp.status_code == 200
+
+    def translate(self, i):
+        resp = self.client.post('/api/translate', json={
+            'text': f"This is subtitle number {self.key(i)}",
+            'target_lang': 'zh',
+        })
+        return resp.status_code == 200
+
+    def generate_subtitle(self, i):
+        resp = self.client.post('/api/generate-subtitle', data={
+            # 内容随 key 变化，否则按内容哈希合并会让默认模式的请求也被合并
+            'video': (BytesIO(self.video_bytes + str(self.key(i)).encode()), f"clip_{self.key(i)}.mp4"),
+            'ffmpeg_path': str(self.ffmpeg),
+            'whisper_path': str(self.whisper),
+            'model_path': str(self.model),
+            'language': 'auto',
+        }, content_type='multipart/form-data')
+        return resp.status_code == 200
+
+    def download(self, i):
+        host, port = self.media_server.server_address
+        resp = self.client.post('/api/download', json={
+            'url': f"http://{host}:{port}/media/clip_{self.key(i)}.mp4",
+        })
+        return resp.status_code == 200
+
+    def clean_vtt(self, i):
+        target = self.work_dir / f"clean_{i}.vtt"
+        shutil.copyfile(self.vtt_source, target)
+        try:
+            return server.clean_vtt_file(target)
+        finally:
+            target.unlink()
+
+    def handlers(self):
+        return {
+            'tts': self.tts,
+            'translate': self.translate,
+            'generate-subtitle': self.generate_subtitle,
+            'download': self.download,
+            'clean-vtt': self.clean_vtt,
+        }
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='后端接口性能基准测试（使用本地替身）')
+    parser.add_argument('--benchmarks', default=','.join(ALL_BENCHMARKS),
+                        help=f"逗号分隔的测试项，可选: {','.join(ALL_BENCHMARKS)}")
+    parser.add_argument('--requests', type=int, default=50, help='每个测试项的请求数')
+    parser.add_argument('--concurrency', type=int, default=8, help='并发数')
+    parser.add_argument('--identical', action='store_true',
+                        help='所有请求使用相同参数（模拟多人同时观看同一视频）')
+    parser.add_argument('--whisper-latency', type=float, default=0.2, help='假whisper延迟（秒）')
+    parser.add_argument('--tts-latency', type=float, default=0.05, help='假edge_tts延迟（秒）')
+    parser.add_argument('--translate-latency', type=float, default=0.05, help='假翻译延迟（秒）')
+    parser.add_argument('--media-latency', type=float, default=0.0, help='本地视频服务器延迟（秒）')
+    parser.add_argument('--media-kb', type=int, default=256, help='假视频大小（KB）')
+    parser.add_argument('--vtt-cues', type=int, default=2000, help='clean_vtt_file测试的字幕条数')
+    parser.add_argument('--output', help='JSON报告输出路径，默认输出到标准输出')
+    parser.add_argument('--log-level', default='WARNING', help='服务端日志级别')
+    args = parser.parse_args(argv)
+
+    selected = [b.strip() for b in args.benchmarks.split(',') if b.strip()]
+    unknown = [b for b in selected if b not in ALL_BENCHMARKS]
+    if unknown:
+        parser.error(f"未知的测试项: {', '.join(unknown)}")
+    if args.requests < 1:
+        parser.error('--requests 必须大于0')
+    if args.concurrency < 1:
+        parser.error('--concurrency 必须大于0')
+    args.benchmarks = selected
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    logging.getLogger().setLevel(args.log_level)
+    server.logger.setLevel(args.log_level)
+
+    original_cwd = Path.cwd()
+    work_dir = Path(tempfile.mkdtemp(prefix='tts_bench_'))
+    # /api/download 写入相对路径 video/，切换到临时目录避免污染仓库
+    os.chdir(work_dir)
+    bench = None
+
+    try:
+        bench = Bench(args, work_dir)
+        handlers = bench.handlers()
+        results = []
+        for name in args.benchmarks:
+            # yt-dlp 会向标准输出打印大量进度信息，丢弃以免淹没摘要和污染JSON报告
+            with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+                result = run_load(name, handlers[name], args.requests, args.concurrency)
+            results.append(result)
+            print(f"{name}: p50={result['latency_ms']['p50']}ms "
+                  f"p95={result['latency_ms']['p95']}ms "
+                  f"rps={result['throughput_rps']} errors={result['errors']}",
+                  file=sys.stderr)
+    finally:
+        if bench is not None:
+            bench.close()
+        os.chdir(original_cwd)
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    report = {
+        'python': sys.version.split()[0],
+        'platform': sys.platform,
+        'config': {
+            'requests': args.requests,
+            'concurrency': args.concurrency,
+            'identical': args.identical,
+            'whisper_latency': args.whisper_latency,
+            'tts_latency': args.tts_latency,
+            'translate_latency': args.translate_latency,
+            'media_latency': args.media_latency,
+            'media_kb': args.media_kb,
+            'vtt_cues': args.vtt_cues,
+        },
+        'results': results,
+        # 整个进程生命周期的峰值，以及最大的单个替身子进程（ffmpeg/whisper）的峰值
+        'process_peak_rss_kb': process_peak_rss_kb(),
+        'children_peak_rss_kb': process_peak_rss_kb(resource.RUSAGE_CHILDREN),
+    }
+
+    output = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        Path(args.output).write_text(output + '\n', encoding='utf-8')
+    else:
+        print(output)
+    return 0 if all(r['errors'] == 0 for r in results) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
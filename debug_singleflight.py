@@ -0,0 +1,116 @@
+import shutil
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+import server
+
+N = 8
+
+
+def run_concurrently(target, count=N):
+    threads = [threading.Thread(target=target, args=(i,)) for i in range(count)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+
+def check_shared_result():
+    flight = server.SingleFlight()
+    calls = []
+    results = []
+
+    def work():
+        calls.append(1)
+        # Give the other threads time to join the in-flight call
+        time.sleep(0.3)
+        return 'done'
+
+    run_concurrently(lambda i: results.append(flight.do(('demo', 'same'), work)))
+
+    assert len(calls) == 1, f"expected 1 computation, got {len(calls)}"
+    assert results == ['done'] * N, results
+    assert not flight._calls, f"entry left behind: {flight._calls}"
+    print(f"{N} identical calls -> {len(calls)} computation, entry removed")
+
+
+def check_shared_exception():
+    flight = server.SingleFlight()
+    calls = []
+    errors = []
+
+    def work():
+        calls.append(1)
+        time.sleep(0.3)
+        raise RuntimeError('boom')
+
+    def call(i):
+        try:
+            flight.do(('demo', 'fail'), work)
+        except RuntimeError as e:
+            errors.append(str(e))
+
+    run_concurrently(call)
+
+    assert len(calls) == 1, f"expected 1 computation, got {len(calls)}"
+    assert errors == ['boom'] * N, errors
+    assert not flight._calls, f"entry left behind: {flight._calls}"
+
+    # After a failure the next call must compute again
+    assert flight.do(('demo', 'fail'), lambda: 'retry') == 'retry'
+    print(f"{N} identical failing calls -> {len(calls)} computation, exception shared, entry removed")
+
+
+def check_endpoints():
+    """tts() and translate() must coalesce requests with equivalent parameters"""
+    communicate_calls = []
+    translate_calls = []
+
+    class CountingCommunicate:
+        def __init__(self, text, voice, rate='+0%', **kwargs):
+            communicate_calls.append((text, voice, rate))
+
+        async def save(self, audio_fname):
+            time.sleep(0.3)
+            Path(audio_fname).write_bytes(b'ID3')
+
+    class CountingTranslator:
+        def __init__(self, source='auto', target='en', **kwargs):
+            self.target = target
+
+        def translate(self, text, **kwargs):
+            translate_calls.append((text, self.target))
+            time.sleep(0.3)
+            return f"[{self.target}] {text}"
+
+    server.edge_tts.Communicate = CountingCommunicate
+    server.GoogleTranslator = CountingTranslator
+    server.TEMP_DIR = Path(tempfile.mkdtemp(prefix='tts_singleflight_'))
+
+    def tts(i):
+        client = server.app.test_client()
+        resp = client.post('/api/tts', json={'text': 'hello', 'rate': 1.0 if i % 2 else '+0%'})
+        assert resp.status_code == 200, resp.get_json()
+
+    def translate(i):
+        client = server.app.test_client()
+        resp = client.post('/api/translate', json={'text': 'hello', 'target_lang': 'zh' if i % 2 else 'zh-CN'})
+        assert resp.status_code == 200, resp.get_json()
+
+    try:
+        run_concurrently(tts)
+        run_concurrently(translate)
+    finally:
+        shutil.rmtree(server.TEMP_DIR, ignore_errors=True)
+
+    assert len(communicate_calls) == 1, communicate_calls
+    assert len(translate_calls) == 1, translate_calls
+    assert not server.single_flight._calls, server.single_flight._calls
+    print(f"/api/tts x{N} -> {len(communicate_calls)} Communicate, /api/translate x{N} -> {len(translate_calls)} translator call")
+
+
+check_shared_result()
+check_shared_exception()
+check_endpoints()
@@ -14,6 +14,9 @@ from pathlib import Path
 import json
 import logging
 import asyncio
+import hashlib
+import threading
+from concurrent.futures import Future
 import edge_tts
 import edge_tts
 from deep_translator import GoogleTranslator
@@ -43,6 +46,39 @@ TEMP_DIR = Path(tempfile.gettempdir()) / 'tts_video_player'
 TEMP_DIR.mkdir(exist_ok=True)
 
 
+class SingleFlight:
+    """合并相同参数的并发请求: 同一时刻只执行一次计算，其余请求等待并共享结果"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key, fn, *args, **kwargs):
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = Future()
+                self._calls[key] = future
+
+        if not leader:
+            logger.info(f"合并相同请求: {key[0]}")
+            return future.result()
+
+        try:
+            future.set_result(fn(*args, **kwargs))
+        except BaseException as e:
+            future.set_exception(e)
+        finally:
+            # 完成后立即移除，之后的请求重新计算
+            with self._lock:
+                del self._calls[key]
+        return future.result()
+
+
+single_flight = SingleFlight()
+
+
 def extract_audio(video_path, audio_path, ffmpeg_path='ffmpeg'):
     """从视频提取音频"""
     try:
@@ -168,6 +204,53 @@ def health_check():
     return jsonify({'status': 'ok', 'message': '后端服务运行正常'})
 
 
+def _generate_subtitle(video_file, ffmpeg_path, whisper_path, model_path, language):
+    """提取音频并转录，返回 (响应内容, 状态码)"""
+    # 创建临时工作目录
+    work_dir = TEMP_DIR / f"job_{os.urandom(8).hex()}"
+    work_dir.mkdir(exist_ok=True)
+
+    try:
+        # 保存上传的视频
+        video_path = work_dir / video_file.filename
+        video_file.save(str(video_path))
+        logger.info(f"视频已保存: {video_path}")
+
+        # 提取音频
+        audio_path = work_dir / f"{video_path.stem}.wav"
+        logger.info("开始提取音频...")
+        if not extract_audio(video_path, audio_path, ffmpeg_path):
+            return {'error': '音频提取失败，请检查ffmpeg路径'}, 500
+
+        logger.info("音频提取成功")
+
+        # 转录音频
+        logger.info("开始转录音频...")
+        vtt_file = transcribe_audio(audio_path, work_dir, whisper_path, model_path, language)
+        if not vtt_file:
+            return {'error': '字幕生成失败，请检查whisper路径和模型路径'}, 500
+
+        logger.info(f"字幕生成成功: {vtt_file}")
+
+        # 读取VTT内容
+        with open(vtt_file, 'r', encoding='utf-8') as f:
+            vtt_content = f.read()
+
+        return {
+            'success': True,
+            'subtitle': vtt_content,
+            'format': 'vtt'
+        }, 200
+
+    finally:
+        # 清理临时文件
+        try:
+            shutil.rmtree(work_dir)
+            logger.info(f"清理临时目录: {work_dir}")
+        except Exception as e:
+            logger.warning(f"清理临时文件失败: {str(e)}")
+
+
 @app.route('/api/generate-subtitle', methods=['POST'])
 def generate_subtitle():
     """生成字幕"""
@@ -189,49 +272,17 @@ def generate_subtitle():
         if not model_path:
             return jsonify({'error': '未配置Whisper模型路径'}), 400
 
-        # 创建临时工作目录
-        work_dir = TEMP_DIR / f"job_{os.urandom(8).hex()}"
-        work_dir.mkdir(exist_ok=True)
-
-        try:
-            # 保存上传的视频
-            video_path = work_dir / video_file.filename
-            video_file.save(str(video_path))
-            logger.info(f"视频已保存: {video_path}")
-
-            # 提取音频
-            audio_path = work_dir / f"{video_path.stem}.wav"
-            logger.info("开始提取音频...")
-            if not extract_audio(video_path, audio_path, ffmpeg_path):
-                return jsonify({'error': '音频提取失败，请检查ffmpeg路径'}), 500
-
-            logger.info("音频提取成功")
-
-            # 转录音频
-            logger.info("开始转录音频...")
-            vtt_file = transcribe_audio(audio_path, work_dir, whisper_path, model_path, language)
-            if not vtt_file:
-                return jsonify({'error': '字幕生成失败，请检查whisper路径和模型路径'}), 500
-
-            logger.info(f"字幕生成成功: {vtt_file}")
-
-            # 读取VTT内容
-            with open(vtt_file, 'r', encoding='utf-8') as f:
-                vtt_content = f.read()
-
-            return jsonify({
-                'success': True,
-                'subtitle': vtt_content,
-                'format': 'vtt'
-            })
+        # 按视频内容和配置合并相同的并发请求
+        digest = hashlib.sha256()
+        for chunk in iter(lambda: video_file.stream.read(1024 * 1024), b''):
+            digest.update(chunk)
+        video_file.stream.seek(0)
+        key = ('generate-subtitle', digest.hexdigest(), ffmpeg_path, whisper_path, model_path, language)
 
-        finally:
-            # 清理临时文件
-            try:
-                shutil.rmtree(work_dir)
-                logger.info(f"清理临时目录: {work_dir}")
-            except Exception as e:
-                logger.warning(f"清理临时文件失败: {str(e)}")
+        result, status = single_flight.do(
+            key, _generate_subtitle, video_file, ffmpeg_path, whisper_path, model_path, language
+        )
+        return jsonify(result), status
 
     except Exception as e:
         logger.error(f"生成字幕时出错: {str(e)}", exc_info=True)
@@ -252,6 +303,40 @@ def get_voices():
         return jsonify({'error': str(e)}), 500
 
 
+def _synthesize_speech(text, voice, rate_str):
+    """调用edge-tts合成音频，返回音频地址和时长"""
+    # 创建临时文件
+    output_file = TEMP_DIR / f"tts_{os.urandom(8).hex()}.mp3"
+
+    async def _generate():
+        communicate = edge_tts.Communicate(text, voice, rate=rate_str)
+        await communicate.save(str(output_file))
+
+    asyncio.run(_generate())
+    
+    # 获取音频时长 (简单估算或使用ffmpeg获取准确时长)
+    # 这里为了准确性，我们使用ffmpeg获取时长
+    duration = 0
+    try:
+        result = subprocess.run(
+            ['ffmpeg', '-i', str(output_file)],
+            capture_output=True,
+            text=True
+        )
+        # ffmpeg输出在stderr中: Duration: 00:00:05.12
+        match = re.search(r"Duration: (\d{2}):(\d{2}):(\d{2}\.\d{2})", result.stderr)
+        if match:
+            h, m, s = map(float, match.groups())
+            duration = h * 3600 + m * 60 + s
+    except Exception as e:
+        logger.warning(f"获取时长失败: {e}")
+
+    return {
+        'url': f"/api/static/{output_file.name}",
+        'duration': duration
+    }
+
+
 @app.route('/api/tts', methods=['POST'])
 def tts():
     """生成TTS音频"""
@@ -264,9 +349,6 @@ def tts():
         if not text:
             return jsonify({'error': '缺少文本参数'}), 400
 
-        # 创建临时文件
-        output_file = TEMP_DIR / f"tts_{os.urandom(8).hex()}.mp3"
-        
         # 调整语速格式
         # edge-tts接受 "+50%", "-20%" 这样的格式
         # 如果传入的是数字 (e.g. 1.2, 0.8), 需要转换
@@ -276,40 +358,21 @@ def tts():
         else:
             rate_str = rate
 
-        async def _generate():
-            communicate = edge_tts.Communicate(text, voice, rate=rate_str)
-            await communicate.save(str(output_file))
-
-        asyncio.run(_generate())
-        
-        # 获取音频时长 (简单估算或使用ffmpeg获取准确时长)
-        # 这里为了准确性，我们使用ffmpeg获取时长
-        duration = 0
-        try:
-            result = subprocess.run(
-                ['ffmpeg', '-i', str(output_file)],
-                capture_output=True,
-                text=True
-            )
-            # ffmpeg输出在stderr中: Duration: 00:00:05.12
-            import re
-            match = re.search(r"Duration: (\d{2}):(\d{2}):(\d{2}\.\d{2})", result.stderr)
-            if match:
-                h, m, s = map(float, match.groups())
-                duration = h * 3600 + m * 60 + s
-        except Exception as e:
-            logger.warning(f"获取时长失败: {e}")
-
-        return jsonify({
-            'url': f"/api/static/{output_file.name}",
-            'duration': duration
-        })
+        # 多个观众同时请求同一条字幕时只合成一次
+        result = single_flight.do(('tts', text, voice, rate_str), _synthesize_speech, text, voice, rate_str)
+        return jsonify(result)
 
     except Exception as e:
         logger.error(f"TTS生成失败: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
 
+def _translate_text(text, target):
+    """使用deep-translator调用Google翻译"""
+    translator = GoogleTranslator(source='auto', target=target)
+    return translator.translate(text)
+
+
 @app.route('/api/translate', methods=['POST'])
 def translate():
     """翻译文本 (使用Google Translate)"""
@@ -340,9 +403,7 @@ def translate():
         
         target = lang_map.get(target_lang, target_lang)
         
-        # 使用deep-translator调用Google翻译
-        translator = GoogleTranslator(source='auto', target=target)
-        translated = translator.translate(text)
+        translated = single_flight.do(('translate', text, target), _translate_text, text, target)
         
         return jsonify({'translatedText': translated})
 
@@ -489,90 +550,97 @@ def clean_vtt_file(file_path):
         logger.error(f"Failed to clean VTT file: {str(e)}")
         return False
 
+def _download_video(url):
+    """使用yt-dlp下载视频和字幕，返回 (响应内容, 状态码)"""
+    # 创建video目录
+    video_dir = Path('video')
+    video_dir.mkdir(exist_ok=True)
+
+    logger.info(f"开始下载视频: {url}")
+
+    # yt-dlp配置
+    ydl_opts = {
+        'format': 'bestvideo+bestaudio/best',  # 下载最佳质量
+        'merge_output_format': 'mp4',          # 强制合并为mp4
+        'outtmpl': str(video_dir / '%(title)s.%(ext)s'),
+        'writesubtitles': True,
+        'writeautomaticsub': True,
+        'subtitleslangs': ['zh-Hans'],  # 仅下载简体中文（包含自动翻译）
+        'sleep_interval_subtitles': 61, # 字幕下载延时61秒，避免429错误
+        'skip_download': False,
+        'noplaylist': True,
+        'http_headers': {
+            'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
+            'Referer': 'https://www.youtube.com/',
+        }
+    }
+
+    info = None
+    filename = None
+
+    try:
+        logger.info("尝试下载视频和字幕...")
+        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+            info = ydl.extract_info(url, download=True)
+            filename = ydl.prepare_filename(info)
+    except Exception as e:
+        logger.error(f"下载失败: {str(e)}")
+        return {'error': str(e)}, 500
+
+    # 查找生成的字幕文件
+    base_name = Path(filename).stem
+
+    # 清理VTT字幕文件 (去除重复行)
+    for ext in ['.vtt']:
+         for lang in ['zh-Hans', 'zh-CN', 'zh-Hant', 'en']:
+            sub_path = video_dir / f"{base_name}.{lang}{ext}"
+            if sub_path.exists():
+                clean_vtt_file(sub_path)
+
+    subtitle_files = []
+
+    # 常见的字幕扩展名
+    for ext in ['.vtt', '.srt']:
+        # 检查可能的字幕文件
+        for lang in ['zh-Hans', 'zh-CN', 'zh-Hant', 'en']:
+            sub_path = video_dir / f"{base_name}.{lang}{ext}"
+            if sub_path.exists():
+                subtitle_files.append({
+                    'lang': lang,
+                    'path': f"/video/{sub_path.name}",
+                    'name': sub_path.name
+                })
+
+        # 检查默认字幕 (没有语言后缀)
+        default_sub = video_dir / f"{base_name}{ext}"
+        if default_sub.exists():
+            subtitle_files.append({
+                'lang': 'default',
+                'path': f"/video/{default_sub.name}",
+                'name': default_sub.name
+            })
+
+        return {
+            'success': True,
+            'video_url': f"/video/{Path(filename).name}",
+            'video_name': Path(filename).name,
+            'subtitles': subtitle_files
+        }, 200
+
+
 @app.route('/api/download', methods=['POST'])
 def download_video():
     """下载视频和字幕"""
     try:
         data = request.json
-        url = data.get('url')
+        url = (data.get('url') or '').strip()
         
         if not url:
             return jsonify({'error': 'URL is required'}), 400
 
-        # 创建video目录
-        video_dir = Path('video')
-        video_dir.mkdir(exist_ok=True)
-
-        logger.info(f"开始下载视频: {url}")
-
-        # yt-dlp配置
-        ydl_opts = {
-            'format': 'bestvideo+bestaudio/best',  # 下载最佳质量
-            'merge_output_format': 'mp4',          # 强制合并为mp4
-            'outtmpl': str(video_dir / '%(title)s.%(ext)s'),
-            'writesubtitles': True,
-            'writeautomaticsub': True,
-            'subtitleslangs': ['zh-Hans'],  # 仅下载简体中文（包含自动翻译）
-            'sleep_interval_subtitles': 61, # 字幕下载延时61秒，避免429错误
-            'skip_download': False,
-            'noplaylist': True,
-            'http_headers': {
-                'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
-                'Referer': 'https://www.youtube.com/',
-            }
-        }
-
-        info = None
-        filename = None
-
-        try:
-            logger.info("尝试下载视频和字幕...")
-            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                info = ydl.extract_info(url, download=True)
-                filename = ydl.prepare_filename(info)
-        except Exception as e:
-            logger.error(f"下载失败: {str(e)}")
-            return jsonify({'error': str(e)}), 500
-        
-        # 查找生成的字幕文件
-        base_name = Path(filename).stem
-        
-        # 清理VTT字幕文件 (去除重复行)
-        for ext in ['.vtt']:
-             for lang in ['zh-Hans', 'zh-CN', 'zh-Hant', 'en']:
-                sub_path = video_dir / f"{base_name}.{lang}{ext}"
-                if sub_path.exists():
-                    clean_vtt_file(sub_path)
-
-        subtitle_files = []
-        
-        # 常见的字幕扩展名
-        for ext in ['.vtt', '.srt']:
-            # 检查可能的字幕文件
-            for lang in ['zh-Hans', 'zh-CN', 'zh-Hant', 'en']:
-                sub_path = video_dir / f"{base_name}.{lang}{ext}"
-                if sub_path.exists():
-                    subtitle_files.append({
-                        'lang': lang,
-                        'path': f"/video/{sub_path.name}",
-                        'name': sub_path.name
-                    })
-            
-            # 检查默认字幕 (没有语言后缀)
-            default_sub = video_dir / f"{base_name}{ext}"
-            if default_sub.exists():
-                subtitle_files.append({
-                    'lang': 'default',
-                    'path': f"/video/{default_sub.name}",
-                    'name': default_sub.name
-                })
-
-            return jsonify({
-                'success': True,
-                'video_url': f"/video/{Path(filename).name}",
-                'video_name': Path(filename).name,
-                'subtitles': subtitle_files
-            })
+        # 多人提交同一URL时只下载一次
+        result, status = single_flight.do(('download', url), _download_video, url)
+        return jsonify(result), status
 
     except Exception as e:
         logger.error(f"下载失败: {str(e)}")